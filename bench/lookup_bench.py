@@ -0,0 +1,40 @@
+""" Microbenchmark of successful and failed lookups on a deep node
+
+Failed lookups are what hasattr style probing, as done by templating
+languages, costs. Run from the top of the repository:
+
+    python bench/lookup_bench.py
+
+"""
+from __future__ import print_function
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import gics
+
+
+def deep_node(depth):
+    cur = root = gics.ConfigNode("root")
+    for i in range(depth):
+        child = gics.ConfigNode("level{0}".format(i))
+        cur._append(child)
+        cur = child
+    cur.value = 1
+    return cur
+
+
+def main():
+    number = 100000
+    for depth in (1, 10, 50):
+        node = deep_node(depth)
+        hit = timeit.timeit(lambda: node.value, number=number)
+        miss = timeit.timeit(lambda: hasattr(node, "missing"), number=number)
+        print("depth {0:3d}: hit {1:6.3f} us, miss {2:6.3f} us".format(
+            depth, hit / number * 1e6, miss / number * 1e6))
+
+
+if __name__ == "__main__":
+    main()
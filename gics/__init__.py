@@ -1,2 +1,5 @@
 from __future__ import absolute_import
-from .gics import Config, ConfigNode, DirNode, REF_DELIMS, get_error, get_ref
+from .gics import (Config, ConfigDiff, ConfigNode, DirNode, REF_DELIMS, diff,
+                   get_error, get_ref, join, link_refs, pack, query,
+                   unresolved_refs)
+from .schema import Schema, SchemaError
@@ -0,0 +1,191 @@
+""" Command line access to gics configs
+
+Usage:
+    python -m gics get CONFIG PATH
+    python -m gics query CONFIG PATTERN
+    python -m gics dump CONFIG [PATH]
+    python -m gics unresolved CONFIG
+    python -m gics validate CONFIG SCHEMA
+    python -m gics profile CONFIG
+    python -m gics cache CONFIG DB
+
+    CONFIG is a directory, json file or bundle, as for gics.Config, and
+    --name sets the name of the root node, which defaults to "config".
+    Paths are dotted paths, with or without the name of the root.
+
+    get prints a single value, query prints every value matching a pattern
+    such as "servers.*.ip", dump prints a subtree as json, unresolved lists
+    the references which don't link to anything, validate checks the config
+    against a schema in a json file (see gics.schema) and profile reports
+    how long loading and linking took.
+
+    Loading a large config every time is slow, so the cache command writes
+    the config into an SQLite store (see gics.store). get, query, dump and
+    unresolved take --cache DB, and read from the store instead of loading
+    the config as long as nothing in CONFIG has changed since. Only the
+    nodes along the path asked for are read, so the lookup itself takes
+    milliseconds however large the config is.
+
+    Checking that nothing has changed takes one stat per file and directory
+    in CONFIG, which dominates for large config directories, especially on
+    network filesystems. Either pack the config into a bundle (see
+    gics.pack), which is a single file to check, or pass --trust-cache to
+    skip the check when whatever rebuilds the cache is known to run after
+    every change.
+
+"""
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from . import gics
+
+
+def _load(args):
+    """ Returns the root of the config, from the cache if it is fresh """
+    if getattr(args, "cache", None) and os.path.exists(args.cache):
+        from .store import SqliteStore
+        store = SqliteStore(args.cache)
+        if store.is_fresh(args.config, args.name,
+                          check_files=not args.trust_cache):
+            return store.root()
+        print("gics: {0} is out of date, loading {1}".format(
+            args.cache, args.config), file=sys.stderr)
+    return gics.Config(args.config, args.name)
+
+
+def _find(config, path):
+    """ Returns the value at a dotted path, or exits if there isn't one """
+    parts = path.split(".") if path else []
+    if parts and parts[0] == config._name:
+        parts = parts[1:]
+    try:
+        return config._lookup(parts)
+    except (KeyError, AttributeError):
+        sys.exit("gics: nothing at {0}".format(path))
+
+
+def _dumps(value, indent=None):
+    if isinstance(value, gics.ConfigNode):
+        value = value._to_dict()
+    return json.dumps(value, default=gics._json_default, indent=indent)
+
+
+def get(args):
+    value = _find(_load(args), args.path)
+    if isinstance(value, basestring):
+        print(value)
+    else:
+        print(_dumps(value))
+
+
+def query(args):
+    for path, value in gics.query(_load(args), args.pattern):
+        print(path + "\t" + _dumps(value))
+
+
+def dump(args):
+    print(_dumps(_find(_load(args), args.path), indent=4))
+
+
+def unresolved(args):
+    found = False
+    for path, ref in gics.unresolved_refs(_load(args)):
+        print(path + "\t" + ref)
+        found = True
+    return 1 if found else 0
+
+
+def validate(args):
+    from .schema import Schema, SchemaError
+    with open(args.schema, "r") as f:
+        schema = Schema(json.load(f))
+    try:
+        gics.Config(args.config, args.name, schema=schema)
+    except SchemaError as e:
+        for path, message in e.violations:
+            print(path + ": " + message)
+        return 1
+    return 0
+
+
+def profile(args):
+    start = time.time()
+    config = gics.Config(args.config, args.name)
+    total = time.time() - start
+    nodes = leaves = 0
+    for _, value in config._walk(leaves=True, paths=False):
+        if isinstance(value, gics.ConfigNode):
+            nodes += 1
+        else:
+            leaves += 1
+    for name, value in config._load_stats.items():
+        print("{0}: {1}".format(name, value))
+    print("total_seconds: {0}".format(total))
+    print("nodes: {0}".format(nodes))
+    print("leaves: {0}".format(leaves))
+
+
+def cache(args):
+    from .store import SqliteStore
+    SqliteStore(args.db).load(args.config, args.name)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m gics",
+        description="Query, validate and profile gics configs"
+    )
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("config", help="config directory, json file or bundle")
+    common.add_argument("--name", default="config",
+                        help="name of the root node (default: config)")
+    cached = argparse.ArgumentParser(add_help=False)
+    cached.add_argument("--cache", metavar="DB",
+                        help="SQLite store made by the cache command")
+    cached.add_argument("--trust-cache", action="store_true",
+                        help="use the cache without checking the files in "
+                             "CONFIG for changes")
+    commands = parser.add_subparsers(dest="command")
+
+    p = commands.add_parser("get", parents=[common, cached],
+                            help="print the value at a path")
+    p.add_argument("path")
+    p.set_defaults(func=get)
+    p = commands.add_parser("query", parents=[common, cached],
+                            help="print every value matching a pattern")
+    p.add_argument("pattern", help='dotted path, where "*" matches anything')
+    p.set_defaults(func=query)
+    p = commands.add_parser("dump", parents=[common, cached],
+                            help="print a subtree as json")
+    p.add_argument("path", nargs="?", default="")
+    p.set_defaults(func=dump)
+    p = commands.add_parser("unresolved", parents=[common, cached],
+                            help="list references which don't link")
+    p.set_defaults(func=unresolved)
+    p = commands.add_parser("validate", parents=[common],
+                            help="check the config against a schema")
+    p.add_argument("schema", help="json file holding the schema")
+    p.set_defaults(func=validate)
+    p = commands.add_parser("profile", parents=[common],
+                            help="time loading and linking the config")
+    p.set_defaults(func=profile)
+    p = commands.add_parser("cache", parents=[common],
+                            help="write the config into an SQLite store")
+    p.add_argument("db")
+    p.set_defaults(func=cache)
+
+    args = parser.parse_args(argv)
+    if not hasattr(args, "func"):
+        parser.error("a command is required")
+    return args.func(args) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
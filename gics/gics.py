@@ -75,8 +75,15 @@ from __future__ import unicode_literals
 from __future__ import absolute_import
 from __future__ import print_function
 
+import hashlib
 import json
+import numbers
 import os
+import sys
+import tarfile
+import time
+import zipfile
+from collections import deque, namedtuple
 # Old pythons don't have ordered dict
 try:
     from collections import OrderedDict
@@ -104,42 +111,85 @@ def raise_error(e):
     raise e
 
 
-def Config(path_or_paths, name):
+def Config(path_or_paths, name, store=None, intern=False, schema=None):
     """ Returns a ConfigNode object created and instantiated from the arguments
     
-    This is the normal method of using gics. There are three options for the
+    This is the normal method of using gics. There are four options for the
     first arg - you can pass in a dictionary of directories or json files, you
-    can pass in a json file directly or you can pass in a directory to be
-    loaded.
+    can pass in a json file directly, you can pass in a directory to be
+    loaded or you can pass in a zip or tar bundle of a directory, as made by
+    gics.pack.
     
     Note that Config({"dir1": "dir/dir1"}, "config") returns a "config" 
     node with the directory contents loaded under dir1 whereas
     Config("dir/dir1", "config") returns a "config" node with the
     contents directly underneath
     
+    If store is given, the tree is written to an SQLite file of that name
+    instead of being built in memory, and nodes are paged in from it as they
+    are accessed. See gics.store for details.
+    
+    If intern is True, equal strings and numbers, including those in lists,
+    are shared between all the nodes of the tree, which saves a lot of memory when the
+    same values are repeated across many json files. The saving is reported
+    in the _load_stats dictionary of the returned node, along with the time
+    taken to load and to link the config.
+    
+    If schema is given, each node is checked against it as it is loaded, and
+    the references it names are checked as they are linked. See gics.schema
+    for details. Neither intern nor schema can be used with a store.
+    
     Args:
         path_or_paths: dictionary of json files and directories or...
                        json file or...
-                       directory
+                       directory or...
+                       zip or tar bundle
+        store: Optional file name of an SQLite database to load into
+        intern: Whether to share equal values between nodes
+        schema: Optional gics.Schema to check the config against
     Returns: A ConfigNode object
+    Raises: gics.SchemaError listing every violation of the schema, or
+        ValueError if schema or intern are given along with store
     
     """
+    if store is not None:
+        if schema is not None or intern:
+            raise ValueError("schema and intern can't be used with a store")
+        from .store import SqliteStore
+        return SqliteStore(store).load(path_or_paths, name)
     config = None
+    loader = Loader(intern, schema)
+    start = time.time()
     if isinstance(path_or_paths, dict):
         config = ConfigNode(name)
+        if loader.checking:
+            loader.enter(name)
         for n, d in path_or_paths.items():
-            config._append(DirNode(n, d))
+            config._append(DirNode(n, d, loader))
+        if loader.checking:
+            loader.leave(config)
     elif path_or_paths[-5:] == ".json":
-        config = JsonNode(name, path_or_paths)
+        config = JsonNode(name, path_or_paths, loader)
+    elif _is_archive(path_or_paths):
+        config = ArchiveNode(name, path_or_paths, loader)
     else:
         try:
-            config = DirNode(name, path_or_paths)
+            config = DirNode(name, path_or_paths, loader)
         except OSError as e:
             if e.errno == 20:
                 pass
             else:
                 raise e
+    loaded = time.time()
     link_refs(config)
+    loader.stats["load_seconds"] = loaded - start
+    loader.stats["link_seconds"] = time.time() - loaded
+    config.__dict__["_load_stats"] = loader.stats
+    if schema is not None:
+        schema._check_refs(loader)
+        if loader.errors:
+            from .schema import SchemaError
+            raise_error(SchemaError(loader.errors))
     return(config)
 
 
@@ -161,34 +211,61 @@ def link_refs(config):
     changes = True
     while changes:
         changes = False
-        for c in config._walk_children():
-            for name, attrib in c._children.items():
-                # Lists are tricky. Go to each member and link it if it is
-                # a reference.
-                # TODO: In future we should deal with things nested inside lists
-                if isinstance(attrib, list):
-                    out_list = []
-                    for i in attrib:
-                        if isinstance(i, basestring):
-                            r = get_ref(config, i)
-                            if r is None:
-                                out_list.append(i)
-                            else:
-                                # TODO: Deconvert lists - they won't save properly
-                                out_list.append(r)
-                                changes = True
-                        else:
-                            out_list.append(i)
-                    c._children[name] = out_list
-                elif isinstance(attrib, basestring):
-                    r = get_ref(config, attrib)
-                    if r is not None:
-                        c._reference_children[name] = r
-                        del c._children[name]
-                        changes = True
-                    else:
-                        pass
-                        # print("Failed to get ref for " + attrib)
+        for _, c in config._walk(paths=False):
+            for name in list(c._children):
+                if _link_child(config, c, name):
+                    changes = True
+
+
+def _link_child(config, node, name):
+    """ Links any references in one normal child of a node
+
+    Args:
+        config: The root ConfigNode references are relative to
+        node: The ConfigNode holding the child
+        name: The name of the child
+    Returns: True if any references were linked
+
+    """
+    if name not in node._children:
+        return False
+    attrib = node._children[name]
+    # Lists are tricky. Go to each member and link it if it is
+    # a reference.
+    # TODO: In future we should deal with things nested inside lists
+    if isinstance(attrib, list):
+        changes = False
+        out_list = []
+        for i in attrib:
+            if isinstance(i, basestring):
+                r = get_ref(config, i)
+                if r is None:
+                    out_list.append(i)
+                else:
+                    # TODO: Deconvert lists - they won't save properly
+                    out_list.append(r)
+                    changes = True
+            else:
+                out_list.append(i)
+        if changes:
+            node._changing(name)
+            node._children[name] = out_list
+        return changes
+    elif isinstance(attrib, basestring):
+        r = get_ref(config, attrib)
+        if r is not None:
+            node._changing(name)
+            node._reference_children[name] = r
+            del node._children[name]
+            return True
+    return False
+
+
+def _is_ref(value):
+    """ Whether value is a string of the form <<x.y.z>> """
+    return (isinstance(value, basestring)
+            and value[0:2] == REF_DELIMS[0]
+            and value[-2:] == REF_DELIMS[1])
 
 
 def get_ref(config, name, debug=False):
@@ -201,23 +278,18 @@ def get_ref(config, name, debug=False):
         otherwise either the ConfigNode or other oject at that position
         
     """
-    if (not (name[0:2] == REF_DELIMS[0] and name[-2:] == REF_DELIMS[1])):
+    if not _is_ref(name):
         return None
     path = name[2:-2].split(".")
-    cur = config
-    if path[0] == cur._name:
+    if path[0] == config._name:
         path = path[1:]
-    for p in path:
-        try:
-            cur = cur._any_children(p)
-        except KeyError:
-            if debug:
-                print("missed", name, "(" + p + ")")
-            return None
-    if (isinstance(cur, basestring)
-            and len(cur) > 4
-            and cur[0:2] == REF_DELIMS[0]
-            and cur[-2:] == REF_DELIMS[1]):
+    try:
+        cur = config._lookup(path)
+    except KeyError as e:
+        if debug:
+            print("missed", name, "(" + e.args[0] + ")")
+        return None
+    if _is_ref(cur) and len(cur) > 4:
         return None
         
     return cur
@@ -236,8 +308,322 @@ def join(configs, name):
     for c in configs:
         parent._append(c)
     return parent
+
+
+def query(config, pattern):
+    """ Finds everything in a config matching a dotted path pattern
+    
+    Each part of the pattern is either a name or "*", which matches every
+    child, so "servers.*.ip" finds the ip of every server. References are
+    followed like any other child.
+    
+    Args:
+        config: The ConfigNode to search from
+        pattern: The dotted path pattern, relative to config
+    Returns: A list of (path, value) tuples, where path is the dotted path
+        of a match relative to config
+    
+    """
+    matches = [("", config)]
+    for part in pattern.split("."):
+        next_matches = []
+        for path, node in matches:
+            if not isinstance(node, ConfigNode):
+                continue
+            prefix = path + "." if path else ""
+            if part == "*":
+                next_matches.extend((prefix + name, value)
+                                    for name, value, _ in node._items())
+            elif part in node._reference_children:
+                next_matches.append((prefix + part,
+                                     node._reference_children[part]))
+            elif part in node._children:
+                next_matches.append((prefix + part, node._children[part]))
+        matches = next_matches
+    return matches
+
+
+def unresolved_refs(config):
+    """ Finds the reference strings in a config which didn't link
     
+    Args:
+        config: A linked ConfigNode
+    Yields: (path, reference) tuples, where path is the dotted path of the
+        leaf relative to config
     
+    """
+    for path, value in config._walk(nodes=False, leaves=True):
+        if isinstance(value, list):
+            for i in value:
+                if _is_ref(i):
+                    yield path, i
+        elif _is_ref(value):
+            yield path, value
+
+
+ConfigDiff = namedtuple("ConfigDiff", ["added", "removed", "changed"])
+
+
+def diff(a, b):
+    """ Compares two config trees and reports the paths which differ
+
+    Subtrees with the same content hash are skipped without being walked, so
+    the cost of a diff depends on how much has changed rather than on the
+    size of the trees. References are compared by the path they point at.
+
+    Args:
+        a: The old ConfigNode
+        b: The new ConfigNode
+    Returns: A ConfigDiff of three lists - added, removed and changed - each
+        holding dotted paths relative to a and b
+
+    """
+    result = ConfigDiff([], [], [])
+    _diff_nodes(a, b, result)
+    return result
+
+
+def _diff_nodes(a, b, result):
+    """ Adds the differences between nodes a and b to result
+
+    Uses a stack rather than recursing, so deep trees can't hit the recursion
+    limit. The stack holds pairs of nodes still to compare, and (list, path)
+    pairs of paths to report, pushed in reverse so that paths are reported
+    in the order of a depth first walk.
+
+    """
+    stack = [(a, b, "")]
+    while stack:
+        item = stack.pop()
+        if len(item) == 2:
+            item[0].append(item[1])
+            continue
+        a, b, prefix = item
+        if a._content_hash() == b._content_hash():
+            continue
+        a_items = OrderedDict((n, (v, s)) for n, v, s in a._items())
+        b_items = OrderedDict((n, (v, s)) for n, v, s in b._items())
+        todo = []
+        for name, (a_value, a_struct) in a_items.items():
+            path = prefix + "." + name if prefix else name
+            if name not in b_items:
+                todo.append((result.removed, path))
+                continue
+            b_value, b_struct = b_items[name]
+            if a_struct and b_struct:
+                todo.append((a_value, b_value, path))
+            elif (a_struct != b_struct
+                    or _value_hash(a_value) != _value_hash(b_value)):
+                todo.append((result.changed, path))
+        for name in b_items:
+            if name not in a_items:
+                todo.append((result.added,
+                             prefix + "." + name if prefix else name))
+        stack.extend(reversed(todo))
+
+
+def _ref_path(node):
+    """ The path of a node relative to the root of its tree
+
+    Used in place of the node itself when hashing references, so that
+    circular references terminate and trees with differently named roots
+    can still be compared.
+
+    """
+    return node._canon_name().partition(".")[2]
+
+
+def _json_default(o):
+    if isinstance(o, ConfigNode):
+        return REF_DELIMS[0] + _ref_path(o) + REF_DELIMS[1]
+    return repr(o)
+
+
+def _value_hash(value):
+    """ A hash of a leaf value, or of a reference to a ConfigNode """
+    j = json.dumps(value, sort_keys=True, default=_json_default)
+    return hashlib.sha1(j.encode("utf-8")).hexdigest()
+    
+    
+_batches = []
+
+
+def _find_batch(node):
+    """ Returns the innermost active batch covering node, or None """
+    cur = node
+    while cur is not None:
+        for batch in reversed(_batches):
+            if batch._node is cur:
+                return batch
+        cur = cur._parent
+    return None
+
+
+class Batch(object):
+    """ A transaction over changes to a config tree
+
+    Created by ConfigNode._batch. While a batch is active, each node which
+    changes has its children copied once, so the batch can be rolled back,
+    and the names of the changed children are kept so that only those need
+    linking when the batch is committed.
+
+    """
+    def __init__(self, node):
+        self._node = node
+        self._saved = OrderedDict()
+        self._parents = OrderedDict()
+        self._changed = []
+
+
+    def __enter__(self):
+        _batches.append(self)
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self._rollback()
+            return False
+        try:
+            self._commit()
+        except Exception:
+            self._rollback()
+            raise
+        return False
+
+
+    def _record(self, node, name, appended):
+        """ Notes that a child of node is about to change """
+        if id(node) not in self._saved:
+            self._saved[id(node)] = (node,
+                                     node._children.copy(),
+                                     node._reference_children.copy())
+        if appended is not None and id(appended) not in self._parents:
+            self._parents[id(appended)] = (appended, appended._parent)
+        self._changed.append((node, name))
+
+
+    def _commit(self):
+        """ Links references in the changed children and ends the batch """
+        config = self._node
+        while config._parent is not None:
+            config = config._parent
+        todo = []
+        for node, name in self._changed:
+            value = node._children.get(name)
+            if isinstance(value, ConfigNode) and value._parent is node:
+                for _, c in value._walk(paths=False):
+                    todo.extend((c, n) for n in c._children)
+            else:
+                todo.append((node, name))
+        changes = True
+        while changes:
+            changes = False
+            for node, name in todo:
+                if _link_child(config, node, name):
+                    changes = True
+        self._end()
+        # Let an enclosing batch roll back or relink these changes too
+        outer = _find_batch(self._node)
+        if outer is not None:
+            for k, v in self._saved.items():
+                outer._saved.setdefault(k, v)
+            for k, v in self._parents.items():
+                outer._parents.setdefault(k, v)
+            outer._changed.extend(self._changed)
+
+
+    def _rollback(self):
+        """ Undoes every change made during the batch and ends it """
+        self._end()
+        for node, parent in self._parents.values():
+            node._forget_path_info()
+            node.__dict__["_parent"] = parent
+        for node, children, reference_children in self._saved.values():
+            node._children.clear()
+            node._children.update(children)
+            node._reference_children.clear()
+            node._reference_children.update(reference_children)
+            node._invalidate_hash()
+
+
+    def _end(self):
+        if self in _batches:
+            _batches.remove(self)
+
+
+class Loader(object):
+    """ Options and statistics shared by all the nodes of one load
+    
+    When interning, every string and number which is loaded, including the
+    members of lists, is looked up in a table, and if an equal value has
+    been loaded before then that value is used instead. Only immutable values
+    are shared - each node still gets its own lists, so changing a list in
+    place only changes it for that node.
+    
+    When there is a schema, the loader also keeps track of the path of the
+    node being loaded, so that each node can be checked as soon as it is
+    loaded. Nodes must then call enter with their name before loading their
+    children and leave once they are done. Without interning or a schema,
+    nodes skip the loader altogether so that plain loads cost nothing extra.
+    
+    """
+    def __init__(self, intern=False, schema=None):
+        self._intern = intern
+        self._table = {}
+        self._schema = schema
+        self._path = []
+        self.stats = OrderedDict([("interned", 0), ("bytes_saved", 0)])
+        # Schema violations as (path, message) tuples
+        self.errors = []
+        # Fields holding references, to check once they are linked
+        self.refs = []
+
+
+    @property
+    def checking(self):
+        """ Whether nodes need to call enter and leave """
+        return self._schema is not None
+
+
+    def enter(self, name):
+        """ Notes that the children of the node called name are loading """
+        self._path.append(name)
+
+
+    def leave(self, node=None):
+        """ Notes that a node has finished loading, and checks it """
+        if node is not None and self._schema is not None:
+            self._schema._check(self._path[1:], ".".join(self._path), node,
+                                self)
+        self._path.pop()
+
+
+    def value(self, value):
+        """ Returns the shared copy of value if interning, else value
+        
+        Lists are never shared, but their members are interned in place
+        
+        """
+        if not self._intern:
+            return value
+        if isinstance(value, list):
+            value[:] = [self.value(i) for i in value]
+            return value
+        elif isinstance(value, float):
+            # 0.0 == -0.0, so key on the repr to keep the sign
+            key = (float, repr(value))
+        elif isinstance(value, (basestring, numbers.Number)):
+            key = (type(value), value)
+        else:
+            return value
+        shared = self._table.setdefault(key, value)
+        if shared is not value:
+            self.stats["interned"] += 1
+            self.stats["bytes_saved"] += sys.getsizeof(value)
+        return shared
+
+
 class ConfigNode(object):
     """ The most basic config node type
     
@@ -255,25 +641,42 @@ class ConfigNode(object):
         self.__dict__["_children"] = OrderedDict()
         self.__dict__["_reference_children"] = OrderedDict()
         self.__dict__["_parent"] = None
+        self.__dict__["_hash"] = None
+        self.__dict__["_path_cache"] = None
         
     def __str__(self):
         return self._name
 
     
-    def _load_dict(self, d):
+    def _load_dict(self, d, loader=None):
         """ Load a dictionary with the items as children of this node
         
         Args:
             d: A dictionary-like object
+            loader: Optional Loader shared by all the nodes being loaded
             
         """
+        intern = None
+        if loader is not None and loader._intern:
+            intern = loader.value
+        checking = loader is not None and loader.checking
         for key, value in d.items():
+            if intern is not None:
+                key = intern(key)
             if  isinstance(value, dict):
                 new_node = ConfigNode(key)
                 self._append(new_node)
-                new_node._load_dict(value)
+                if checking:
+                    loader.enter(key)
+                    new_node._load_dict(value, loader)
+                    loader.leave(new_node)
+                else:
+                    new_node._load_dict(value, loader)
+            elif intern is not None:
+                self._children[key] = intern(value)
             else:
                 self._children[key] = value
+        self._invalidate_hash()
 
 
     def _append(self, node):
@@ -283,7 +686,13 @@ class ConfigNode(object):
             node: A ConfigNode object
             
         """
+        self._changing(node._name, node)
         self._children[node._name] = node
+        if node.__dict__["_path_cache"] is not None:
+            node._forget_path_info()
+        if node._parent is not None and node._parent is not self:
+            # The old parent no longer owns node, so its hash changes too
+            node._parent._invalidate_hash()
         node._parent = self
 
 
@@ -297,6 +706,7 @@ class ConfigNode(object):
             node: A ConfigNode object to be referenced
             
         """
+        self._changing(node._name)
         self._reference_children[node._name] = node
 
         
@@ -316,8 +726,10 @@ class ConfigNode(object):
     def __setattr__(self, name, value):
         # We can't set attr before we have inited
         if name in self._reference_children:
+            self._changing(name)
             self._reference_children[name] = value
         elif name in self._children:
+            self._changing(name)
             self._children[name] = value
         elif name not in self.__dict__:
             self._set(name, value)
@@ -327,12 +739,118 @@ class ConfigNode(object):
 
 
     def _set(self, name, value):
+        self._changing(name)
         if isinstance(value, ConfigNode):
             self._reference_children[name] = value
         else:
             self._children[name] = value
 
 
+    def _changing(self, name, appended=None):
+        """ Must be called just before a child of this node is changed
+
+        Invalidates the content hash, and records the change with the
+        enclosing batch if there is one.
+
+        Args:
+            name: The name of the child about to change
+            appended: The ConfigNode being appended under name, if any
+
+        """
+        self._invalidate_hash()
+        if _batches:
+            batch = _find_batch(self)
+            if batch is not None:
+                batch._record(self, name, appended)
+
+
+    def _batch(self):
+        """ Groups changes to the tree below this node into one transaction
+
+        Use as a context manager:
+
+            with config._batch():
+                config.servers._append(new_server)
+                config.clusters.cluster1.db_server = "<<servers.db3>>"
+
+        Changes take effect straight away, but references are only linked
+        when the block exits, and then only within the children which were
+        set or appended. If the block or the linking raises, every change is
+        rolled back.
+
+        Returns: A Batch object
+
+        """
+        return Batch(self)
+
+
+    def _invalidate_hash(self):
+        """ Forgets the cached content hash of this node and its parents
+
+        Must be called whenever the children of this node change. Stops at
+        the first node without a cached hash, since a parent can only have a
+        cached hash if all of its children do.
+
+        """
+        cur = self
+        while cur is not None and cur.__dict__["_hash"] is not None:
+            cur.__dict__["_hash"] = None
+            cur = cur._parent
+
+
+    def _content_hash(self):
+        """ A structural hash of everything underneath this node
+
+        Covers the names and values of all children and leaves, but not the
+        name of the node itself. Child nodes contribute their own content
+        hash, while references contribute the path they point at. The result
+        is cached until _invalidate_hash is called.
+
+        Note that changing a list in place doesn't invalidate the hash - set
+        the list again to do so.
+
+        Returns: A hex digest string
+
+        """
+        if self.__dict__["_hash"] is None:
+            # Hash children before their parents rather than recursing, so
+            # deep trees can't hit the recursion limit
+            todo = [self]
+            for node in todo:
+                todo.extend(v for _, v, structural in node._items()
+                            if structural and v.__dict__["_hash"] is None)
+            for node in reversed(todo):
+                sha = hashlib.sha1()
+                for name, value, structural in node._items():
+                    if structural:
+                        entry = [name, "node", value.__dict__["_hash"]]
+                    else:
+                        entry = [name, "leaf", _value_hash(value)]
+                    sha.update(json.dumps(entry).encode("utf-8"))
+                node.__dict__["_hash"] = sha.hexdigest()
+        return self.__dict__["_hash"]
+
+
+    def _items(self):
+        """ Iterates over all the children of this node
+
+        Where a name is both a reference child and a normal child, only the
+        reference is returned.
+
+        Yields: (name, value, structural) tuples, where structural is True if
+            the value is a ConfigNode owned by this node rather than a
+            reference to one
+
+        """
+        for name, value in self._reference_children.items():
+            yield name, value, False
+        for name, value in self._children.items():
+            if name not in self._reference_children:
+                structural = (isinstance(value, ConfigNode)
+                              and value._parent is self)
+                yield name, value, structural
+
+
     def _canon_name(self):
         """ The canonical name of this node
         
@@ -342,13 +860,58 @@ class ConfigNode(object):
         Returns: The canonical representation of the name of this node
         
         """
-        parents = [self._name,]
-        cur = self
-        while cur._parent is not None:
-            cur = cur._parent
-            parents.append(cur._name)
-        parents.reverse()
-        return ".".join(parents)
+        return self._path_info()[0]
+
+
+    def _depth(self):
+        """ The number of parents above this node """
+        return self._path_info()[1]
+
+
+    def _path_info(self):
+        """ The canonical name and depth of this node
+        
+        Both are cached on each node on first use, along with those of any
+        parents which weren't cached yet, so repeat calls are O(1). Lookup
+        errors use the canonical name, so this keeps failed lookups cheap.
+        
+        Returns: A (canonical name, depth) tuple
+        
+        """
+        info = self.__dict__["_path_cache"]
+        if info is None:
+            chain = []
+            cur = self
+            while cur is not None and cur.__dict__["_path_cache"] is None:
+                chain.append(cur)
+                cur = cur._parent
+            for node in reversed(chain):
+                if cur is None:
+                    info = (node._name, 0)
+                else:
+                    parent_info = cur.__dict__["_path_cache"]
+                    info = (parent_info[0] + "." + node._name,
+                            parent_info[1] + 1)
+                node.__dict__["_path_cache"] = info
+                cur = node
+        return info
+
+
+    def _forget_path_info(self):
+        """ Clears the cached path info of this node and everything below it
+        
+        Must be called when the node moves to a new parent. Only descends
+        into nodes with cached info, since a node can only have cached info
+        if its parent does.
+        
+        """
+        todo = [self]
+        while todo:
+            node = todo.pop()
+            if node.__dict__["_path_cache"] is not None:
+                node.__dict__["_path_cache"] = None
+                todo.extend(v for _, v, structural in node._items()
+                            if structural)
     
     
     def _walk_children(self):
@@ -357,13 +920,66 @@ class ConfigNode(object):
         Yields: One ConfigNode object at a time. Only node though - no leaves
         
         """
-        yield self
-        for c in self._children.values():
-            if isinstance(c, ConfigNode):
-                for cc in c._walk_children():
-                    yield cc
-                
-                
+        for _, node in self._walk(paths=False):
+            yield node
+
+
+    def _walk(self, breadth_first=False, nodes=True, leaves=False,
+              follow_refs=False, paths=True):
+        """ Walks this node and everything below it
+        
+        Uses an explicit stack rather than recursion, so the cost of each
+        step doesn't depend on the depth of the tree. Children are visited in
+        the same order as iterating over a node.
+        
+        Args:
+            breadth_first: Visit each level before the next, rather than
+                           depth first
+            nodes: Yield ConfigNodes
+            leaves: Yield leaves. Lists are single leaves
+            follow_refs: Walk into referenced ConfigNodes too. Each node is
+                         only visited once, so circular references are fine
+            paths: Build the path of each value. If False, every path is
+                   None, which saves building a string for each child
+        Yields: (path, value) tuples, where path is the dotted path of the
+            value relative to this node, with "" for this node itself
+        
+        """
+        todo = deque([("" if paths else None, self, True)])
+        take = todo.popleft if breadth_first else todo.pop
+        seen = set([id(self)])
+        while todo:
+            path, value, is_node = take()
+            if not is_node:
+                yield path, value
+                continue
+            if nodes:
+                yield path, value
+            items = []
+            for name, child, structural in value._items():
+                if not isinstance(child, ConfigNode):
+                    if not leaves:
+                        continue
+                    is_child_node = False
+                elif follow_refs:
+                    if id(child) in seen:
+                        continue
+                    seen.add(id(child))
+                    is_child_node = True
+                elif structural:
+                    is_child_node = True
+                else:
+                    continue
+                if paths:
+                    items.append((path + "." + name if path else name, child,
+                                  is_child_node))
+                else:
+                    items.append((None, child, is_child_node))
+            if not breadth_first:
+                items.reverse()
+            todo.extend(items)
+
+
     def _any_children(self, name):
         """ Returns the first child with a given name
          
@@ -380,6 +996,45 @@ class ConfigNode(object):
             raise_error(KeyError("No children called " + name))
 
 
+    def _to_dict(self):
+        """ Converts this node and everything below it into dictionaries
+        
+        References to ConfigNodes are left as ConfigNodes. Dump the result
+        with json.dumps(d, default=gics.gics._json_default) to turn them back
+        into reference strings.
+        
+        Returns: An OrderedDict
+        
+        """
+        d = OrderedDict()
+        # Fill in the dictionaries top down rather than recursing, so deep
+        # trees can't hit the recursion limit
+        todo = [(self, d)]
+        for node, node_d in todo:
+            for name, value, structural in node._items():
+                if structural:
+                    node_d[name] = OrderedDict()
+                    todo.append((value, node_d[name]))
+                else:
+                    node_d[name] = value
+        return d
+
+
+    def _lookup(self, path):
+        """ Finds the object at a path below this node
+
+        Args:
+            path: A list of child names, one for each level
+        Returns: The ConfigNode or leaf at that path
+        Raises: KeyError if there is nothing at that path
+
+        """
+        cur = self
+        for p in path:
+            cur = cur._any_children(p)
+        return cur
+
+
     # Methods to emulate container types:
     def __len__(self):
         return len(self._children) + len(self._reference_children)
@@ -405,8 +1060,10 @@ class ConfigNode(object):
 
     def __delitem__(self, key):
         if key in self._reference_children:
+            self._changing(key)
             del(self._reference_children[key])
         elif key in self._children:
+            self._changing(key)
             del(self._children[key])
         else:
             raise KeyError("{0} not in {1}".format(key, self._canon_name()))
@@ -420,34 +1077,51 @@ class ConfigNode(object):
 
 
 class DirNode(ConfigNode):
-    def __init__(self, name, dir_name):
-        """ Takes a directory name as well """
+    def __init__(self, name, dir_name, loader=None):
+        """ Takes a directory name and optionally a Loader as well """
         ConfigNode.__init__(self, name)
         self.__dict__["_dir_name"] = dir_name
-        for item in os.listdir(dir_name):
+        items = os.listdir(dir_name)
+        checking = loader is not None and loader.checking
+        if checking:
+            loader.enter(name)
+        for item in items:
             if item[-5:] == ".json":
-                self._append(JsonNode(item[0:-5], dir_name + "/" + item))
+                self._append(JsonNode(item[0:-5], dir_name + "/" + item,
+                                      loader))
             else:
                 try:
-                    self._append(DirNode(item, dir_name + "/" + item))
+                    self._append(DirNode(item, dir_name + "/" + item, loader))
                 except OSError as e:
                     if e.errno in (20, 22):
                         pass
                     else:
                         raise e
+        if checking:
+            loader.leave(self)
 
 
 class JsonNode(ConfigNode):
-    def __init__(self, name, file_name):
-        """ Takes a filename as well """
+    def __init__(self, name, file_name, loader=None, f=None):
+        """ Takes a filename and optionally a Loader as well
+        
+        If f is given, the json is read from that file object instead of
+        opening file_name
+        
+        """
         ConfigNode.__init__(self, name)
         self.__dict__["_file_name"] = file_name
-        with open(file_name, "r") as f:
-            try:
-                j = json.load(f)
-            except ValueError as e:
-                raise ValueError("Bad json file " + file_name, e)
-        self._load_dict(j)
+        if f is None:
+            with open(file_name, "r") as f:
+                j = _load_json(f, file_name)
+        else:
+            j = _load_json(f, file_name)
+        checking = loader is not None and loader.checking
+        if checking:
+            loader.enter(name)
+        self._load_dict(j, loader)
+        if checking:
+            loader.leave(self)
 
             
     def _save(self, file_name=None):
@@ -457,3 +1131,145 @@ class JsonNode(ConfigNode):
         #TODO: Do a save
         # iterate through children, if a ref then stick a ref in, else jsonarize
 
+
+class ArchiveNode(ConfigNode):
+    def __init__(self, name, archive_name, loader=None):
+        """ Takes the file name of a zip or tar bundle as well
+        
+        Builds the same tree as a DirNode of the directory the bundle was
+        packed from. The bundle is read once from start to finish, and each
+        json member is parsed as it is reached, so nothing is extracted to
+        disk and only one member is held in memory at a time.
+        
+        """
+        ConfigNode.__init__(self, name)
+        self.__dict__["_archive_name"] = archive_name
+        checking = loader is not None and loader.checking
+        if checking:
+            loader.enter(name)
+        # Directories may get more members later, so they are checked last
+        dirs = []
+        for path, f in _archive_members(archive_name):
+            parts = path.split("/")
+            if f is not None:
+                parts[-1] = parts[-1][0:-5]
+            cur = self
+            for i, p in enumerate(parts[:-1]):
+                if p not in cur._children:
+                    cur._append(ConfigNode(p))
+                    dirs.append((parts[:i + 1], cur._children[p]))
+                cur = cur._children[p]
+            if f is not None:
+                if checking:
+                    for p in parts[:-1]:
+                        loader.enter(p)
+                cur._append(JsonNode(parts[-1], archive_name + "/" + path,
+                                     loader, f))
+                if checking:
+                    for p in parts[:-1]:
+                        loader.leave()
+            elif parts[-1] not in cur._children:
+                cur._append(ConfigNode(parts[-1]))
+                dirs.append((parts, cur._children[parts[-1]]))
+        if checking:
+            for parts, node in dirs:
+                for p in parts:
+                    loader.enter(p)
+                loader.leave(node)
+                for p in parts[:-1]:
+                    loader.leave()
+            loader.leave(self)
+
+
+def _load_json(f, file_name):
+    """ Parses json from the file object f, which was opened from file_name """
+    try:
+        return json.load(f)
+    except ValueError as e:
+        raise ValueError("Bad json file " + file_name, e)
+
+
+_ARCHIVE_MODES = (
+    (".zip", None),
+    (".tar", "w"),
+    (".tar.gz", "w:gz"),
+    (".tgz", "w:gz"),
+    (".tar.bz2", "w:bz2"),
+    (".tbz2", "w:bz2"),
+)
+
+
+def _is_archive(file_name):
+    return any(file_name.endswith(ext) for ext, _ in _ARCHIVE_MODES)
+
+
+def _archive_members(archive_name):
+    """ Reads the directories and json files in a bundle in order
+    
+    Yields: (path, f) tuples, where path is the "/" separated path of the
+        member within the bundle and f is a file object for a json member or
+        None for a directory. Each f is only valid until the next tuple
+    
+    """
+    if archive_name.endswith(".zip"):
+        with zipfile.ZipFile(archive_name) as z:
+            # Read in the order the members are stored in, so the read is
+            # sequential
+            for info in sorted(z.infolist(), key=lambda i: i.header_offset):
+                path = info.filename.strip("/")
+                if info.filename.endswith("/"):
+                    yield path, None
+                elif path[-5:] == ".json":
+                    yield path, z.open(info)
+    else:
+        # Stream mode never seeks backwards
+        with tarfile.open(archive_name, "r|*") as t:
+            for info in t:
+                path = info.name
+                if path.startswith("./"):
+                    path = path[2:]
+                path = path.strip("/")
+                if not path or path == ".":
+                    continue
+                if info.isdir():
+                    yield path, None
+                elif info.isfile() and path[-5:] == ".json":
+                    yield path, t.extractfile(info)
+
+
+def pack(dir_name, archive_name):
+    """ Packs a config directory into a bundle which Config can load
+    
+    Only the directories and json files which DirNode would load are packed.
+    Symlinks are followed, as they are by DirNode, and the files and
+    directories they point at are packed in their place.
+    The type of bundle is picked from the extension of archive_name, which
+    can be .zip, .tar, .tar.gz, .tgz, .tar.bz2 or .tbz2
+    
+    Args:
+        dir_name: The config directory to pack
+        archive_name: The file name of the bundle to write
+    
+    """
+    members = []
+    for root, dirs, files in os.walk(dir_name, followlinks=True):
+        dirs.sort()
+        rel = os.path.relpath(root, dir_name).replace(os.sep, "/")
+        prefix = "" if rel == "." else rel + "/"
+        if prefix:
+            members.append((prefix, root))
+        for f in sorted(files):
+            if f[-5:] == ".json":
+                members.append((prefix + f, os.path.join(root, f)))
+    if archive_name.endswith(".zip"):
+        with zipfile.ZipFile(archive_name, "w", zipfile.ZIP_DEFLATED) as z:
+            for arcname, file_name in members:
+                z.write(file_name, arcname)
+        return
+    modes = [m for ext, m in _ARCHIVE_MODES if archive_name.endswith(ext)]
+    if not modes:
+        raise ValueError("Unknown bundle type " + archive_name)
+    # Store the files symlinks point at, since DirNode follows them
+    with tarfile.open(archive_name, modes[-1], dereference=True) as t:
+        for arcname, file_name in members:
+            t.add(file_name, arcname.rstrip("/"), recursive=False)
@@ -0,0 +1,198 @@
+""" Schemas checked while a config is loaded
+
+Usage:
+    A schema maps dotted paths, relative to the root of the config, to the
+    fields which nodes at that path must have. A "*" matches any one name:
+
+        schema = gics.Schema({
+            "servers.*": {
+                "required": ["ip", "cores"],
+                "properties": {
+                    "ip": {"type": "string"},
+                    "cores": {"type": "integer"}
+                }
+            },
+            "clusters.*": {
+                "required": ["db_server"],
+                "properties": {"db_server": {"type": "ref"}}
+            }
+        })
+        config = gics.Config("config/", "config", schema=schema)
+
+    The types are the json schema types "string", "integer", "number",
+    "boolean", "array", "object" and "null", plus "ref" for a reference
+    which must link to something in the tree. A list of types allows any of
+    them. A field holding a reference is checked against the type of the
+    thing it links to, so "<<servers.web1>>" is an "object" as well as a
+    "ref".
+
+    The schema is compiled once into a tree of checkers, and each node is
+    checked as soon as it has been loaded, so no extra walk of the config is
+    needed. Fields holding references are checked again once references have
+    been linked. A reference which doesn't link is only an error if the field
+    allows "ref" - otherwise it is checked as the string it still is. If
+    anything fails, Config raises a SchemaError listing every violation.
+
+"""
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from __future__ import print_function
+
+import json
+import numbers
+
+from . import gics
+from .gics import _is_ref
+
+
+_TYPES = {
+    "string": lambda v: isinstance(v, basestring),
+    "integer": lambda v: (isinstance(v, numbers.Integral)
+                          and not isinstance(v, bool)),
+    "number": lambda v: (isinstance(v, numbers.Number)
+                         and not isinstance(v, bool)),
+    "boolean": lambda v: isinstance(v, bool),
+    "array": lambda v: isinstance(v, list),
+    "object": lambda v: isinstance(v, gics.ConfigNode),
+    "null": lambda v: v is None,
+    # Only references which failed to link are still strings
+    "ref": lambda v: False,
+}
+
+
+class SchemaError(ValueError):
+    """ Raised with every schema violation found in a config
+
+    Attributes:
+        violations: A list of (path, message) tuples, where path is the
+                    canonical name of the node or field at fault
+
+    """
+    def __init__(self, violations):
+        self.violations = violations
+        ValueError.__init__(self, "\n".join(
+            "{0}: {1}".format(path, message) for path, message in violations
+        ))
+
+
+class _Level(object):
+    """ One level of the compiled schema tree """
+    def __init__(self):
+        self.children = {}
+        self.wildcard = None
+        self.checkers = []
+
+
+class Schema(object):
+    """ A compiled schema, ready to pass to Config """
+    def __init__(self, spec):
+        """ Compiles a schema
+
+        Args:
+            spec: A dictionary of paths to node schemas, as described in the
+                  module documentation
+        Raises: ValueError if the spec uses an unknown type
+
+        """
+        self._root = _Level()
+        for pattern, node_spec in spec.items():
+            level = self._root
+            for p in (pattern.split(".") if pattern else []):
+                if p == "*":
+                    if level.wildcard is None:
+                        level.wildcard = _Level()
+                    level = level.wildcard
+                else:
+                    level = level.children.setdefault(p, _Level())
+            level.checkers.append(self._compile(pattern, node_spec))
+
+
+    def _compile(self, pattern, node_spec):
+        """ Turns the schema for one path into a (required, fields) tuple
+
+        fields is a list of (name, check, types) tuples, where check is a
+        function returning whether a value is one of the named types
+
+        """
+        fields = []
+        for name, field_spec in node_spec.get("properties", {}).items():
+            types = field_spec.get("type", [])
+            if isinstance(types, basestring):
+                types = [types]
+            for t in types:
+                if t not in _TYPES:
+                    raise ValueError("Unknown type {0} for {1} in {2}".format(
+                        t, name, pattern))
+            checks = [_TYPES[t] for t in types]
+            if checks:
+                check = lambda v, checks=checks: any(c(v) for c in checks)
+            else:
+                check = lambda v: True
+            fields.append((name, check, types))
+        return tuple(node_spec.get("required", [])), fields
+
+
+    def _check(self, path, canon, node, loader):
+        """ Checks a freshly loaded node, adding violations to the loader
+
+        Args:
+            path: The names of the node and its parents, excluding the root
+            canon: The canonical name of the node
+            node: The ConfigNode to check
+            loader: The Loader collecting violations and references to check
+                    after linking
+
+        """
+        levels = [self._root]
+        for p in path:
+            next_levels = []
+            for level in levels:
+                if p in level.children:
+                    next_levels.append(level.children[p])
+                if level.wildcard is not None:
+                    next_levels.append(level.wildcard)
+            if not next_levels:
+                return
+            levels = next_levels
+        for level in levels:
+            for required, fields in level.checkers:
+                for name in required:
+                    if (name not in node._children
+                            and name not in node._reference_children):
+                        loader.errors.append((canon + "." + name,
+                                              "required but missing"))
+                for name, check, types in fields:
+                    if name in node._reference_children:
+                        value = node._reference_children[name]
+                    elif name in node._children:
+                        value = node._children[name]
+                    else:
+                        continue
+                    if _is_ref(value):
+                        # Wait until references have been linked
+                        loader.refs.append((node, name, canon + "." + name,
+                                            check, types))
+                    elif not check(value):
+                        loader.errors.append(_type_error(canon + "." + name,
+                                                         types, value))
+
+
+    def _check_refs(self, loader):
+        """ Checks the fields which held references, once they are linked """
+        for node, name, canon, check, types in loader.refs:
+            if name in node._reference_children:
+                value = node._reference_children[name]
+                if "ref" not in types and not check(value):
+                    loader.errors.append(_type_error(canon, types, value))
+            elif "ref" in types:
+                loader.errors.append((canon, "reference doesn't link to "
+                                             "anything"))
+            elif not check(node._children[name]):
+                # A string which didn't link is just a string
+                loader.errors.append(_type_error(canon, types,
+                                                 node._children[name]))
+
+
+def _type_error(canon, types, value):
+    return canon, "should be {0}, not {1}".format(
+        " or ".join(types), json.dumps(value, default=gics._json_default))
@@ -0,0 +1,464 @@
+""" An SQLite backed node store for configs too large to hold in memory
+
+Usage:
+    Rather than building the whole tree of ConfigNodes, the json files under
+    a config directory or in a bundle made by gics.pack are written one at a
+    time into an SQLite file, which holds three tables:
+        nodes: one row per directory, json file or json object
+        leaves: one row per value, stored as json
+        refs: one row per reference string found in a leaf or list
+
+    The tree is then read back through StoredNode objects, which behave like
+    read-only ConfigNodes. The children of a node are only paged in from the
+    database when they are first accessed, and only the most recently used
+    nodes keep their children in memory.
+
+        config = gics.Config("config/", "config", store="config.db")
+        print config.clusters.cluster1.db_server.ip
+
+    References are not linked up front. Instead they are resolved as nodes
+    are paged in, using indexed queries on the path of the target node.
+
+    An existing database can be reopened without reading the json again:
+
+        config = gics.store.SqliteStore("config.db").root()
+
+"""
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from __future__ import print_function
+
+import json
+import os
+import sqlite3
+import weakref
+# Old pythons don't have ordered dict
+try:
+    from collections import OrderedDict
+except ImportError:
+    from .ordereddict import OrderedDict
+
+from . import gics
+from .gics import ConfigNode, _is_ref, raise_error
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS nodes (
+    id INTEGER PRIMARY KEY, parent INTEGER, pos INTEGER, name TEXT, path TEXT
+);
+CREATE TABLE IF NOT EXISTS leaves (
+    node INTEGER, pos INTEGER, name TEXT, value TEXT
+);
+CREATE TABLE IF NOT EXISTS refs (node INTEGER, name TEXT, target TEXT);
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY, mtime REAL, size INTEGER
+);
+CREATE INDEX IF NOT EXISTS nodes_path ON nodes (path);
+CREATE INDEX IF NOT EXISTS nodes_parent ON nodes (parent, name);
+CREATE INDEX IF NOT EXISTS leaves_node ON leaves (node, name);
+CREATE INDEX IF NOT EXISTS refs_node ON refs (node);
+"""
+
+
+ROOT_ID = 1
+
+
+def _child_path(path, name):
+    """ The dotted path of a child, or None if it would be ambiguous
+
+    A name such as "web1.example.com" would make the path of its node look
+    like that of a node several levels down, so nodes with a dot anywhere
+    in their path have no path and are only found level by level.
+
+    """
+    if path is None or "." in name:
+        return None
+    return path + "." + name if path else name
+
+
+class SqliteStore(object):
+    """ An SQLite file holding a config tree """
+    def __init__(self, db_name, cache_size=1024):
+        """ Open or create the SQLite file called db_name
+
+        Args:
+            db_name: The file name of the database
+            cache_size: The number of nodes to keep paged in at once, which
+                        must be at least 1
+
+        """
+        if cache_size < 1:
+            raise ValueError("cache_size must be at least 1")
+        self._db_name = db_name
+        self._db = sqlite3.connect(db_name)
+        self._db.executescript(_SCHEMA)
+        self._cache_size = cache_size
+        # Nodes with their children paged in, least recently used first
+        self._hot = OrderedDict()
+        # Every StoredNode still in use, so each id maps to only one node
+        self._live = weakref.WeakValueDictionary()
+
+
+    def load(self, path_or_paths, name):
+        """ Replace the contents of the store with a config tree
+
+        Takes the same arguments as gics.Config. Only one json file is held
+        in memory at a time.
+
+        Returns: The root StoredNode
+
+        """
+        db = self._db
+        for table in ("meta", "nodes", "leaves", "refs", "sources"):
+            db.execute("DELETE FROM " + table)
+        self._hot.clear()
+        self._live.clear()
+        db.execute("INSERT INTO meta VALUES ('root', ?)", (name,))
+        db.execute("INSERT INTO meta VALUES ('source', ?)",
+                   (json.dumps(path_or_paths, sort_keys=True),))
+        db.execute("INSERT INTO nodes VALUES (?, NULL, 0, ?, '')",
+                   (ROOT_ID, name))
+        if isinstance(path_or_paths, dict):
+            for pos, (n, d) in enumerate(path_or_paths.items()):
+                self._write_path(ROOT_ID, pos, n, _child_path("", n), d)
+        elif path_or_paths[-5:] == ".json":
+            self._write_json(ROOT_ID, "", path_or_paths)
+        elif gics._is_archive(path_or_paths):
+            self._write_archive(path_or_paths)
+        else:
+            self._write_dir(ROOT_ID, "", path_or_paths)
+        db.commit()
+        return self.root()
+
+
+    def root(self):
+        """ Returns the root StoredNode of the tree in the store """
+        return self._node(ROOT_ID)
+
+
+    def is_fresh(self, path_or_paths, name, check_files=True):
+        """ Whether the store holds an up to date copy of a config
+
+        Compares the arguments with those given to load, and the size and
+        modification time of every directory and file which load read with
+        their current values. Adding or removing a file changes the time of
+        its directory, so that is noticed too.
+
+        Checking the files means one stat per file and directory, which
+        costs far more than a lookup for a large config directory. A config
+        loaded from a bundle is a single file, so it is cheap to check.
+
+        Args:
+            path_or_paths: As for gics.Config
+            name: As for gics.Config
+            check_files: If False, only the arguments are compared and the
+                         files are trusted not to have changed
+        Returns: True if loading again would give the same tree
+
+        """
+        meta = dict(self._db.execute("SELECT key, value FROM meta"))
+        if (meta.get("root") != name or meta.get("source")
+                != json.dumps(path_or_paths, sort_keys=True)):
+            return False
+        if not check_files:
+            return True
+        for path, mtime, size in self._db.execute("SELECT * FROM sources"):
+            try:
+                st = os.stat(path)
+            except OSError:
+                return False
+            if st.st_mtime != mtime or st.st_size != size:
+                return False
+        return True
+
+
+    def _add_source(self, file_name):
+        """ Records the size and time of a file or directory which was read """
+        st = os.stat(file_name)
+        self._db.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?)",
+                         (file_name, st.st_mtime, st.st_size))
+
+
+    def _write_path(self, parent_id, pos, name, path, file_name):
+        """ Writes a directory or json file as a new child node """
+        if file_name[-5:] == ".json":
+            node_id = self._insert_node(parent_id, pos, name, path)
+            self._write_json(node_id, path, file_name)
+        elif os.path.isdir(file_name):
+            node_id = self._insert_node(parent_id, pos, name, path)
+            self._write_dir(node_id, path, file_name)
+
+
+    def _write_dir(self, node_id, path, dir_name):
+        """ Writes the contents of a directory under node_id """
+        self._add_source(dir_name)
+        for pos, item in enumerate(os.listdir(dir_name)):
+            name = item[0:-5] if item[-5:] == ".json" else item
+            self._write_path(node_id, pos, name, _child_path(path, name),
+                             dir_name + "/" + item)
+
+
+    def _write_json(self, node_id, path, file_name):
+        """ Writes the contents of a json file under node_id """
+        self._add_source(file_name)
+        with open(file_name, "r") as f:
+            self._write_dict(node_id, path, gics._load_json(f, file_name))
+
+
+    def _write_archive(self, archive_name):
+        """ Writes the contents of a zip or tar bundle under the root """
+        self._add_source(archive_name)
+        # Keyed on the archive path, which can't be confused like dotted ones
+        ids = {"": (ROOT_ID, "")}
+        counts = {}
+        for member, f in gics._archive_members(archive_name):
+            parts = member.split("/")
+            if f is not None:
+                parts[-1] = parts[-1][0:-5]
+            for i in range(len(parts)):
+                key = "/".join(parts[:i + 1])
+                if key in ids:
+                    continue
+                parent_id, parent_path = ids["/".join(parts[:i])]
+                pos = counts.get(parent_id, 0)
+                counts[parent_id] = pos + 1
+                path = _child_path(parent_path, parts[i])
+                ids[key] = (self._insert_node(parent_id, pos, parts[i], path),
+                            path)
+            if f is not None:
+                file_name = archive_name + "/" + member
+                node_id, path = ids[key]
+                self._write_dict(node_id, path, gics._load_json(f, file_name))
+
+
+    def _write_dict(self, node_id, path, d):
+        """ Writes the items of a dictionary under node_id """
+        leaves = []
+        refs = []
+        for pos, (key, value) in enumerate(d.items()):
+            if isinstance(value, dict):
+                child_path = _child_path(path, key)
+                child_id = self._insert_node(node_id, pos, key, child_path)
+                self._write_dict(child_id, child_path, value)
+                continue
+            leaves.append((node_id, pos, key, json.dumps(value)))
+            if isinstance(value, list):
+                refs.extend((node_id, key, i[2:-2]) for i in value
+                            if _is_ref(i))
+            elif _is_ref(value):
+                refs.append((node_id, key, value[2:-2]))
+        self._db.executemany("INSERT INTO leaves VALUES (?, ?, ?, ?)", leaves)
+        self._db.executemany("INSERT INTO refs VALUES (?, ?, ?)", refs)
+
+
+    def _insert_node(self, parent_id, pos, name, path):
+        cur = self._db.execute(
+            "INSERT INTO nodes (parent, pos, name, path) VALUES (?, ?, ?, ?)",
+            (parent_id, pos, name, path)
+        )
+        return cur.lastrowid
+
+
+    def _node(self, node_id):
+        """ Returns the StoredNode for node_id, without paging it in """
+        node = self._live.get(node_id)
+        if node is None:
+            row = self._db.execute(
+                "SELECT parent, name, path FROM nodes WHERE id = ?",
+                (node_id,)
+            ).fetchone()
+            if row is None:
+                raise_error(KeyError("No node with id {0}".format(node_id)))
+            node = StoredNode(self, node_id, row[1], row[0], row[2])
+            self._live[node_id] = node
+        return node
+
+
+    def _page_in(self, node):
+        """ Loads the children of node from the database
+
+        References among the leaves are resolved as they are read. If more
+        than cache_size nodes are paged in, the children of the least
+        recently used node are dropped.
+
+        """
+        node_id = node._id
+        rows = self._db.execute(
+            "SELECT pos, name, id, NULL FROM nodes WHERE parent = ? "
+            "UNION ALL "
+            "SELECT pos, name, NULL, value FROM leaves WHERE node = ? "
+            "ORDER BY 1", (node_id, node_id)
+        ).fetchall()
+        children = OrderedDict()
+        reference_children = OrderedDict()
+        for _, name, child_id, value in rows:
+            if child_id is not None:
+                children[name] = self._node(child_id)
+                continue
+            value = json.loads(value)
+            if isinstance(value, list):
+                value = [self._resolve(i, i) for i in value]
+            elif _is_ref(value):
+                r = self._resolve(value, None)
+                if r is not None:
+                    reference_children[name] = r
+                    continue
+            children[name] = value
+        node.__dict__["_children"] = children
+        node.__dict__["_reference_children"] = reference_children
+        self._hot[node_id] = node
+        while len(self._hot) > self._cache_size:
+            _, old = self._hot.popitem(last=False)
+            del old.__dict__["_children"]
+            del old.__dict__["_reference_children"]
+
+
+    def _touch(self, node):
+        """ Marks a paged in node as recently used """
+        if node._id in self._hot:
+            self._hot[node._id] = self._hot.pop(node._id)
+
+
+    def _resolve(self, value, default, seen=None):
+        """ Resolves a reference string in the same way as gics.get_ref
+
+        Args:
+            value: The possible reference string
+            default: What to return if value can't be resolved
+            seen: The reference strings already being resolved, used to stop
+                  loops of references to references
+        Returns: The node or leaf referred to, otherwise default
+
+        """
+        if not _is_ref(value):
+            return default
+        seen = seen or frozenset()
+        if value in seen:
+            return default
+        # A new set for each branch, so that siblings don't block each other
+        seen = seen | frozenset([value])
+        path = value[2:-2].split(".")
+        if path[0] == self.root()._name:
+            path = path[1:]
+        try:
+            r = self._lookup(ROOT_ID, path, seen)
+        except KeyError:
+            return default
+        if _is_ref(r):
+            # Points at a reference which didn't resolve either
+            return default
+        return r
+
+
+    def _lookup(self, node_id, path, seen=None):
+        """ Finds the object at a path below node_id with indexed queries
+
+        Args:
+            node_id: The id of the node to start from
+            path: A list of child names, one for each level
+            seen: Reference strings already being resolved
+        Returns: The StoredNode or leaf value at that path
+        Raises: KeyError if there is nothing at that path, or if the path
+            goes through a reference which doesn't resolve
+
+        """
+        db = self._db
+        if node_id == ROOT_ID and not any("." in p for p in path):
+            # Most lookups are for nodes, which are a single query by path
+            row = db.execute("SELECT id FROM nodes WHERE path = ?",
+                             (".".join(path),)).fetchone()
+            if row is not None:
+                return self._node(row[0])
+        for i, p in enumerate(path):
+            row = db.execute(
+                "SELECT id FROM nodes WHERE parent = ? AND name = ?",
+                (node_id, p)
+            ).fetchone()
+            if row is not None:
+                node_id = row[0]
+                continue
+            row = db.execute(
+                "SELECT value FROM leaves WHERE node = ? AND name = ?",
+                (node_id, p)
+            ).fetchone()
+            if row is None:
+                raise_error(KeyError("No children called " + p))
+            value = json.loads(row[0])
+            last = i == len(path) - 1
+            if isinstance(value, list):
+                value = [self._resolve(v, v, seen) for v in value]
+            elif _is_ref(value):
+                r = self._resolve(value, None, seen)
+                if r is not None:
+                    value = r
+                elif not last:
+                    raise_error(KeyError("Unresolved reference " + p))
+            if last:
+                # Like ConfigNode._lookup, an unresolved reference at the
+                # end of the path is returned as its string
+                return value
+            if not isinstance(value, StoredNode):
+                raise_error(KeyError("No children called " + path[i + 1]))
+            node_id = value._id
+        return self._node(node_id)
+
+
+class StoredNode(ConfigNode):
+    """ A read-only ConfigNode whose children live in an SqliteStore
+
+    The children are paged in from the store the first time they are used,
+    and may be dropped again when the node falls out of the store's cache.
+    Because of this, stored nodes can't be modified.
+
+    """
+    def __init__(self, store, node_id, name, parent_id, path):
+        ConfigNode.__init__(self, name)
+        for n in ("_children", "_reference_children", "_parent"):
+            del self.__dict__[n]
+        self.__dict__["_store"] = store
+        self.__dict__["_id"] = node_id
+        self.__dict__["_parent_id"] = parent_id
+        self.__dict__["_path"] = path
+
+
+    def __getattr__(self, name):
+        if name in ("_children", "_reference_children"):
+            self._store._page_in(self)
+            return self.__dict__[name]
+        elif name == "_parent":
+            parent = None
+            if self._parent_id is not None:
+                parent = self._store._node(self._parent_id)
+            self.__dict__["_parent"] = parent
+            return parent
+        self._store._touch(self)
+        return ConfigNode.__getattr__(self, name)
+
+
+    def __setattr__(self, name, value):
+        if name in self.__dict__:
+            self.__dict__[name] = value
+        else:
+            self._read_only()
+
+
+    def __delitem__(self, key):
+        self._read_only()
+
+
+    def _append(self, node):
+        self._read_only()
+
+
+    def _append_ref(self, node):
+        self._read_only()
+
+
+    def _read_only(self):
+        raise_error(TypeError("{0} is read only".format(self._canon_name())))
+
+
+    def _lookup(self, path):
+        """ Finds the object at a path below this node using the store """
+        return self._store._lookup(self._id, path)
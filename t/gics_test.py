@@ -2,8 +2,22 @@ from __future__ import absolute_import
 from __future__ import unicode_literals
 from __future__ import print_function
 
+import gc
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
 import unittest
+import weakref
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
 import gics
+import gics.__main__
+import gics.store
 
 class TestGicsConfig(unittest.TestCase):
     def test_gics_config_dict(self):
@@ -114,3 +128,565 @@ class TestConfigJoin(unittest.TestCase):
         self.assertEqual(c.dir1._name, "dir1")
         self.assertEqual(c.dir2._name, "dir2")
 
+
+
+class TestContentHash(unittest.TestCase):
+    def test_same_content_same_hash(self):
+        c1 = gics.Config("t/data/config1/dir2", "config1")
+        c2 = gics.Config("t/data/config1/dir2", "config2")
+        self.assertEqual(c1._content_hash(), c2._content_hash())
+
+    def test_loops_terminate(self):
+        loop_c = gics.Config("t/data/config1/dir3", "loopy")
+        self.assertTrue(loop_c._content_hash())
+
+    def test_invalidated_up_parents(self):
+        c = gics.Config("t/data/config1/dir2", "config")
+        before = c._content_hash()
+        c.json1.literal1 = "changed"
+        self.assertNotEqual(c._content_hash(), before)
+        c.json1.literal1 = "lit_val1"
+        self.assertEqual(c._content_hash(), before)
+
+    def test_reparent_invalidates_old_parent(self):
+        old = gics.ConfigNode("old")
+        old._append(gics.ConfigNode("child"))
+        before = old._content_hash()
+        gics.ConfigNode("new")._append(old.child)
+        self.assertIsNone(old.__dict__["_hash"])
+        self.assertNotEqual(old._content_hash(), before)
+
+
+class TestDiff(unittest.TestCase):
+    def setUp(self):
+        self.old = gics.Config("t/data/config1/dir2", "old")
+        self.new = gics.Config("t/data/config1/dir2", "new")
+
+    def test_identical(self):
+        self.assertEqual(gics.diff(self.old, self.new), ([], [], []))
+
+    def test_changes(self):
+        self.new.json1.literal1 = "changed"
+        del self.new.json1["float1"]
+        self.new.json1.extra = 5
+        d = gics.diff(self.old, self.new)
+        self.assertEqual(d.added, ["json1.extra"])
+        self.assertEqual(d.removed, ["json1.float1"])
+        self.assertEqual(d.changed, ["json1.literal1"])
+
+    def test_changed_reference(self):
+        self.new.json1.ref1 = self.new.json1.float1
+        self.assertEqual(gics.diff(self.old, self.new).changed, ["json1.ref1"])
+
+    def test_deep_trees(self):
+        depth = sys.getrecursionlimit() * 2
+        roots = []
+        for value in (1, 2):
+            cur = root = gics.ConfigNode("root")
+            for i in range(depth):
+                child = gics.ConfigNode("n")
+                cur._append(child)
+                cur = child
+            cur.leaf = value
+            roots.append(root)
+        self.assertEqual(gics.diff(*roots).changed,
+                         [".".join(["n"] * depth + ["leaf"])])
+        d = roots[0]._to_dict()
+        for i in range(depth):
+            d = d["n"]
+        self.assertEqual(d, {"leaf": 1})
+
+
+class TestSqliteStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db = os.path.join(self.tmp, "config.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_load_dir(self):
+        c = gics.Config("t/data/config1/dir2", "config", store=self.db)
+        self.assertEqual(c.json1.literal1, "lit_val1")
+        self.assertEqual(c.json1.ref1, 1)
+        self.assertEqual(c.json1.list1[2], "lit_val1")
+        self.assertEqual(c.json1._canon_name(), "config.json1")
+
+    def test_loops(self):
+        c = gics.Config("t/data/config1/dir3", "loopy", store=self.db)
+        self.assertEqual(c.loop1.loop2.loop1.loop2.name, "loop2")
+
+    def test_reopen(self):
+        gics.Config("t/data/config1/dir2", "config", store=self.db)
+        c = gics.store.SqliteStore(self.db).root()
+        self.assertEqual(c._name, "config")
+        self.assertEqual(gics.get_ref(c, "<<config.json1.float1>>"), 3.14)
+        self.assertEqual(gics.get_ref(c, "<<json1.ref1>>"), 1)
+        self.assertEqual(gics.get_ref(c, "<<json1.missing>>"), None)
+
+    def test_paging(self):
+        gics.Config("t/data/config1/dir3", "loopy", store=self.db)
+        store = gics.store.SqliteStore(self.db, cache_size=1)
+        c = store.root()
+        loop1 = c.loop1
+        self.assertEqual(loop1.name, "loop1")
+        self.assertEqual(c.loop2.name, "loop2")
+        self.assertFalse("_children" in loop1.__dict__)
+        self.assertEqual(loop1.loop2._name, "loop2")
+
+    def test_read_only(self):
+        c = gics.Config("t/data/config1/dir2", "config", store=self.db)
+        self.assertRaises(TypeError, setattr, c.json1, "literal1", "x")
+
+    def test_lookup_matches_memory(self):
+        c = gics.Config("t/data/config2", "config", store=self.db)
+        m = gics.Config("t/data/config2", "config")
+        for ref in ("<<clusters.cluster1.servers>>",
+                    "<<clusters.cluster1.outward_ip>>"):
+            self.assertEqual(
+                json.dumps(gics.get_ref(c, ref), default=gics.gics._json_default),
+                json.dumps(gics.get_ref(m, ref), default=gics.gics._json_default)
+            )
+        c = gics.Config("t/data/config1/dir2", "config", store=self.db)
+        m = gics.Config("t/data/config1/dir2", "config")
+        self.assertEqual(gics.get_ref(c, "<<json1.list1>>"),
+                         gics.get_ref(m, "<<json1.list1>>"))
+        self.assertEqual(gics.get_ref(c, "<<json1.list1>>")[2], "lit_val1")
+
+    def test_unresolved_leaf(self):
+        c = gics.Config("t/data/config2", "config", store=self.db)
+        m = gics.Config("t/data/config2", "config")
+        path = ["clusters", "cluster1", "db_server"]
+        self.assertEqual(c._lookup(path), "<<servers.db2>>")
+        self.assertEqual(c._lookup(path), m._lookup(path))
+        self.assertRaises(KeyError, c._lookup, path + ["ip"])
+
+    def test_dotted_key(self):
+        config = os.path.join(self.tmp, "config")
+        os.mkdir(config)
+        with open(os.path.join(config, "servers.json"), "w") as f:
+            json.dump({"s1": {"h": {"web1.example.com": {"ip": "1.2.3.4"}},
+                              "web": "<<servers.s1.h.web1.example.com>>"}}, f)
+        c = gics.Config(config, "config", store=self.db)
+        m = gics.Config(config, "config")
+        self.assertEqual(c.servers.s1.h["web1.example.com"].ip, "1.2.3.4")
+        ref = "<<servers.s1.h.web1.example.com>>"
+        self.assertEqual(gics.get_ref(m, ref), None)
+        self.assertEqual(gics.get_ref(c, ref), None)
+        self.assertEqual(list(gics.unresolved_refs(c)),
+                         list(gics.unresolved_refs(m)))
+        self.assertEqual(c._lookup(["servers", "s1", "h", "web1.example.com",
+                                    "ip"]), "1.2.3.4")
+
+    def test_cache_size(self):
+        gics.Config("t/data/config1/dir2", "config", store=self.db)
+        self.assertRaises(ValueError, gics.store.SqliteStore, self.db,
+                          cache_size=0)
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.c = gics.Config("t/data/config1/dir2", "config")
+
+    def test_links_on_commit(self):
+        with self.c._batch():
+            server = gics.ConfigNode("web1")
+            server.cores = "<<json1.int1>>"
+            self.c._append(server)
+            self.c.json1.literal1 = "<<web1>>"
+            self.assertEqual(self.c.web1.cores, "<<json1.int1>>")
+        self.assertEqual(self.c.web1.cores, 1)
+        self.assertEqual(self.c.json1.literal1, self.c.web1)
+
+    def test_rollback(self):
+        before = self.c._content_hash()
+        order = list(self.c.json1)
+        try:
+            with self.c._batch():
+                self.c._append(gics.ConfigNode("web1"))
+                self.c.json1.int1 = 2
+                del self.c.json1["float1"]
+                raise RuntimeError()
+        except RuntimeError:
+            pass
+        self.assertRaises(AttributeError, getattr, self.c, "web1")
+        self.assertEqual(self.c.json1.int1, 1)
+        self.assertEqual(list(self.c.json1), order)
+        self.assertEqual(self.c._content_hash(), before)
+
+    def test_rollback_on_failed_commit(self):
+        def bad_ref(config, name, debug=False):
+            raise ValueError(name)
+        get_ref = gics.gics.get_ref
+        gics.gics.get_ref = bad_ref
+        try:
+            with self.c._batch():
+                self.c.json1.literal1 = "<<json1.int1>>"
+        except ValueError:
+            pass
+        finally:
+            gics.gics.get_ref = get_ref
+        self.assertEqual(self.c.json1.literal1, "lit_val1")
+
+
+class TestWalk(unittest.TestCase):
+    def setUp(self):
+        self.cn = gics.ConfigNode("node1")
+        self.cn._append(gics.ConfigNode("node2"))
+        self.cn._append(gics.ConfigNode("node3"))
+        self.cn.node2._append(gics.ConfigNode("node4"))
+        self.cn.node2.leaf1 = 1
+        self.cn.node3.leaf2 = 2
+        self.cn.node3._append_ref(self.cn.node2)
+
+    def test_depth_first(self):
+        paths = [p for p, _ in self.cn._walk(leaves=True)]
+        self.assertEqual(paths, ["", "node2", "node2.node4", "node2.leaf1",
+                                 "node3", "node3.leaf2"])
+
+    def test_no_paths(self):
+        walked = list(self.cn._walk(leaves=True, paths=False))
+        self.assertEqual([p for p, _ in walked], [None] * 6)
+        self.assertEqual([v for _, v in walked][3], 1)
+
+    def test_breadth_first(self):
+        paths = [p for p, _ in self.cn._walk(breadth_first=True)]
+        self.assertEqual(paths, ["", "node2", "node3", "node2.node4"])
+
+    def test_leaves_only(self):
+        leaves = list(self.cn._walk(nodes=False, leaves=True))
+        self.assertEqual(leaves, [("node2.leaf1", 1), ("node3.leaf2", 2)])
+
+    def test_follow_refs(self):
+        loop_c = gics.Config("t/data/config1/dir3", "loopy")
+        paths = [p for p, _ in loop_c._walk(follow_refs=True)]
+        self.assertEqual(sorted(paths), ["", "loop1", "loop2"])
+        c = gics.ConfigNode("c")
+        c._append(gics.ConfigNode("a"))
+        c._append(gics.ConfigNode("b"))
+        c.a._append_ref(c.b)
+        paths = [p for p, _ in c._walk(follow_refs=True)]
+        self.assertEqual(paths, ["", "a", "b"])
+
+    def test_deep_tree(self):
+        cur = root = gics.ConfigNode("root")
+        for i in range(sys.getrecursionlimit() * 2):
+            child = gics.ConfigNode("n")
+            cur._append(child)
+            cur = child
+        self.assertEqual(len(list(root._walk())), sys.getrecursionlimit() * 2 + 1)
+        self.assertTrue(root._content_hash())
+
+
+class TestIntern(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        for name in ("web1", "web2"):
+            with open(os.path.join(self.tmp, name + ".json"), "w") as f:
+                json.dump({"image": "ubuntu-14.04-server-amd64-" * 4,
+                           "packages": ["nginx", "python2.7", "uwsgi"],
+                           "cores": 123456789}, f)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_intern(self):
+        c = gics.Config(self.tmp, "servers", intern=True)
+        self.assertTrue(c.web1.image is c.web2.image)
+        self.assertFalse(c.web1.packages is c.web2.packages)
+        self.assertTrue(c.web1.packages[0] is c.web2.packages[0])
+        self.assertTrue(c.web1.cores is c.web2.cores)
+        self.assertTrue(c._load_stats["bytes_saved"] > 0)
+
+    def test_no_intern(self):
+        c = gics.Config(self.tmp, "servers")
+        self.assertFalse(c.web1.packages is c.web2.packages)
+        self.assertEqual(c._load_stats["bytes_saved"], 0)
+
+    def test_plain_load_skips_loader(self):
+        calls = []
+        def record(self, *args):
+            calls.append(args)
+        saved = [(n, getattr(gics.gics.Loader, n))
+                 for n in ("value", "enter", "leave")]
+        try:
+            for n, _ in saved:
+                setattr(gics.gics.Loader, n, record)
+            c = gics.Config(self.tmp, "servers")
+        finally:
+            for n, method in saved:
+                setattr(gics.gics.Loader, n, method)
+        self.assertEqual(c.web1.cores, 123456789)
+        self.assertEqual(calls, [])
+
+    def test_reassign(self):
+        c = gics.Config(self.tmp, "servers", intern=True)
+        c.web1.packages = ["apache"]
+        c.web1.image = "centos"
+        self.assertEqual(c.web2.packages, ["nginx", "python2.7", "uwsgi"])
+        self.assertEqual(c.web2.image, "ubuntu-14.04-server-amd64-" * 4)
+
+    def test_append_in_place(self):
+        c = gics.Config(self.tmp, "servers", intern=True)
+        before = c.web2._content_hash()
+        c.web1.packages.append("redis")
+        self.assertEqual(c.web2.packages, ["nginx", "python2.7", "uwsgi"])
+        self.assertEqual(c.web2._content_hash(), before)
+
+    def test_signed_zero(self):
+        with open(os.path.join(self.tmp, "zeros.json"), "w") as f:
+            f.write('{"a": -0.0, "b": 0.0, "c": [-0.0, 0.0]}')
+        c = gics.Config(self.tmp, "servers", intern=True)
+        self.assertEqual(math.copysign(1, c.zeros.a), -1)
+        self.assertEqual(math.copysign(1, c.zeros.b), 1)
+        self.assertEqual([math.copysign(1, v) for v in c.zeros.c], [-1, 1])
+
+
+class TestArchive(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def check_bundle(self, ext):
+        bundle = os.path.join(self.tmp, "config" + ext)
+        gics.pack("t/data/config1", bundle)
+        c = gics.Config(bundle, "config")
+        self.assertEqual(c.dir1._name, "dir1")
+        self.assertEqual(c.dir3.loop1.name, "loop1")
+        self.assertEqual(c.dir2.json1._file_name,
+                         bundle + "/dir2/json1.json")
+        bundle = os.path.join(self.tmp, "dir2" + ext)
+        gics.pack("t/data/config1/dir2", bundle)
+        c = gics.Config(bundle, "config")
+        self.assertEqual(c.json1.list1[2], "lit_val1")
+        expected = gics.Config("t/data/config1/dir2", "config")
+        self.assertEqual(gics.diff(expected, c), ([], [], []))
+
+    def test_zip(self):
+        self.check_bundle(".zip")
+
+    def test_tar(self):
+        self.check_bundle(".tar.gz")
+
+    def test_symlinks(self):
+        config = os.path.join(self.tmp, "config")
+        os.makedirs(os.path.join(config, "servers"))
+        os.symlink(os.path.abspath("t/data/config1/dir2/json1.json"),
+                   os.path.join(config, "servers", "web1.json"))
+        os.symlink(os.path.abspath("t/data/config1/dir3"),
+                   os.path.join(config, "loops"))
+        expected = gics.Config(config, "config")
+        self.assertEqual(sorted(expected.servers), ["web1"])
+        for ext in (".tar", ".zip"):
+            bundle = os.path.join(self.tmp, "config" + ext)
+            gics.pack(config, bundle)
+            c = gics.Config(bundle, "config")
+            self.assertEqual(sorted(c.servers), ["web1"])
+            self.assertEqual(sorted(c.loops), ["loop1", "loop2"])
+            self.assertEqual(gics.diff(expected, c), ([], [], []))
+
+    def test_store(self):
+        bundle = os.path.join(self.tmp, "dir3.tar")
+        gics.pack("t/data/config1/dir3", bundle)
+        db = os.path.join(self.tmp, "config.db")
+        c = gics.Config(bundle, "config", store=db)
+        self.assertEqual(c.loop1.loop2.loop1.name, "loop1")
+
+
+class TestSchema(unittest.TestCase):
+    spec = {
+        "servers.*": {
+            "required": ["ip", "cores"],
+            "properties": {
+                "ip": {"type": "string"},
+                "cores": {"type": "integer"},
+                "cluster": {"type": "object"}
+            }
+        },
+        "clusters.*": {
+            "required": ["db_server", "web_server"],
+            "properties": {
+                "db_server": {"type": "ref"},
+                "web_server": {"type": "ref"},
+                "outward_ip": {"type": "string"},
+                "servers": {"type": "array"}
+            }
+        }
+    }
+
+    def test_violations(self):
+        schema = gics.Schema(self.spec)
+        try:
+            gics.Config("t/data/config2", "config", schema=schema)
+        except gics.SchemaError as e:
+            self.assertEqual(sorted(e.violations), [
+                ("config.clusters.cluster1.db_server",
+                 "reference doesn't link to anything"),
+                ("config.servers.db1.cores", 'should be integer, not "lots"'),
+            ])
+        else:
+            self.fail("No SchemaError raised")
+
+    def test_valid(self):
+        spec = {"*": {"required": ["literal1"],
+                      "properties": {"ref1": {"type": ["integer", "ref"]}}}}
+        c = gics.Config("t/data/config1/dir2", "config",
+                        schema=gics.Schema(spec))
+        self.assertEqual(c.json1.ref1, 1)
+
+    def test_required(self):
+        schema = gics.Schema({"*": {"required": ["missing"]}})
+        with self.assertRaises(gics.SchemaError) as cm:
+            gics.Config("t/data/config1/dir3", "loopy", schema=schema)
+        self.assertEqual(sorted(p for p, _ in cm.exception.violations),
+                         ["loopy.loop1.missing", "loopy.loop2.missing"])
+
+    def test_bundle(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            bundle = os.path.join(tmp, "config.zip")
+            gics.pack("t/data/config2", bundle)
+            with self.assertRaises(gics.SchemaError) as cm:
+                gics.Config(bundle, "config", schema=gics.Schema(self.spec))
+            self.assertEqual(len(cm.exception.violations), 2)
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_unlinked_string(self):
+        schema = gics.Schema({"clusters.*": {"properties": {
+            "db_server": {"type": "string"}}}})
+        c = gics.Config("t/data/config2", "config", schema=schema)
+        self.assertEqual(c.clusters.cluster1.db_server, "<<servers.db2>>")
+        schema = gics.Schema({"clusters.*": {"properties": {
+            "db_server": {"type": "integer"}}}})
+        with self.assertRaises(gics.SchemaError) as cm:
+            gics.Config("t/data/config2", "config", schema=schema)
+        self.assertEqual(cm.exception.violations, [
+            ("config.clusters.cluster1.db_server",
+             'should be integer, not "<<servers.db2>>"')])
+
+    def test_store(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            db = os.path.join(tmp, "config.db")
+            self.assertRaises(ValueError, gics.Config, "t/data/config2",
+                              "config", store=db,
+                              schema=gics.Schema(self.spec))
+            self.assertRaises(ValueError, gics.Config, "t/data/config2",
+                              "config", store=db, intern=True)
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_unknown_type(self):
+        self.assertRaises(ValueError, gics.Schema,
+                          {"*": {"properties": {"a": {"type": "bogus"}}}})
+
+
+class TestPathInfo(unittest.TestCase):
+    def setUp(self):
+        self.cn = gics.ConfigNode("node1")
+        self.cn._append(gics.ConfigNode("node2"))
+        self.cn.node2._append(gics.ConfigNode("node3"))
+
+    def test_canon_name(self):
+        self.assertEqual(self.cn.node2.node3._canon_name(), "node1.node2.node3")
+        self.assertEqual(self.cn.node2.node3._depth(), 2)
+        self.assertEqual(self.cn._depth(), 0)
+
+    def test_reparent(self):
+        node3 = self.cn.node2.node3
+        self.assertEqual(node3._canon_name(), "node1.node2.node3")
+        other = gics.ConfigNode("other")
+        other._append(self.cn.node2)
+        self.assertEqual(node3._canon_name(), "other.node2.node3")
+        self.assertEqual(node3._depth(), 2)
+        gics.join([other], "top")
+        self.assertEqual(node3._canon_name(), "top.other.node2.node3")
+        self.assertEqual(node3._depth(), 3)
+
+    def test_miss_message(self):
+        with self.assertRaises(AttributeError) as cm:
+            self.cn.node2.node3.missing
+        self.assertEqual(str(cm.exception), "missing not in node1.node2.node3")
+
+    def test_miss_unicode(self):
+        with self.assertRaises(KeyError) as cm:
+            self.cn["caf\xe9"]
+        self.assertTrue("not in node1" in str(cm.exception))
+
+    def test_miss_releases_tree(self):
+        def miss():
+            root = gics.ConfigNode("root")
+            root._append(gics.ConfigNode("child"))
+            try:
+                root.child["missing"]
+            except KeyError:
+                pass
+            return weakref.ref(root)
+        ref = miss()
+        gc.collect()
+        self.assertTrue(gics.get_error() is not None)
+        self.assertTrue(ref() is None)
+
+
+class TestQuery(unittest.TestCase):
+    def setUp(self):
+        self.c = gics.Config("t/data/config2", "config")
+
+    def test_query(self):
+        self.assertEqual(sorted(gics.query(self.c, "servers.*.ip")),
+                         [("servers.db1.ip", "1.2.3.5"),
+                          ("servers.web1.ip", "1.2.3.4")])
+        self.assertEqual(gics.query(self.c, "clusters.*.web_server.cores"),
+                         [("clusters.cluster1.web_server.cores", 24)])
+        self.assertEqual(gics.query(self.c, "servers.*.missing"), [])
+
+    def test_unresolved_refs(self):
+        self.assertEqual(list(gics.unresolved_refs(self.c)),
+                         [("clusters.cluster1.db_server", "<<servers.db2>>")])
+
+
+class TestCli(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.stdout = sys.stdout
+        sys.stdout = StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        shutil.rmtree(self.tmp)
+
+    def run_cli(self, *argv):
+        sys.stdout.seek(0)
+        sys.stdout.truncate()
+        rc = gics.__main__.main(list(argv))
+        return rc, sys.stdout.getvalue()
+
+    def test_get(self):
+        self.assertEqual(self.run_cli("get", "t/data/config2", "servers.web1.ip"),
+                         (0, "1.2.3.4\n"))
+        rc, out = self.run_cli("get", "t/data/config2", "config.servers.web1")
+        self.assertEqual(json.loads(out)["cluster"], "<<clusters.cluster1>>")
+
+    def test_unresolved(self):
+        self.assertEqual(self.run_cli("unresolved", "t/data/config2"),
+                         (1, "clusters.cluster1.db_server\t<<servers.db2>>\n"))
+
+    def test_cache(self):
+        config = os.path.join(self.tmp, "config")
+        shutil.copytree("t/data/config2", config)
+        db = os.path.join(self.tmp, "config.db")
+        self.run_cli("cache", config, db)
+        store = gics.store.SqliteStore(db)
+        self.assertTrue(store.is_fresh(config, "config"))
+        self.assertFalse(store.is_fresh(config, "other"))
+        self.assertEqual(self.run_cli("get", config, "servers.web1.cores",
+                                      "--cache", db), (0, "24\n"))
+        os.remove(os.path.join(config, "servers", "db1.json"))
+        self.assertFalse(store.is_fresh(config, "config"))
+        self.assertTrue(store.is_fresh(config, "config", check_files=False))
+        self.assertEqual(self.run_cli("get", config, "servers.db1.cores",
+                                      "--cache", db, "--trust-cache"),
+                         (0, "lots\n"))